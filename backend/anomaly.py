@@ -1,11 +1,16 @@
 # anomaly.py
 from __future__ import annotations
 import re
-from collections import Counter, defaultdict, deque
-from datetime import datetime, timedelta
+from collections import defaultdict
+from datetime import datetime, timezone
+from functools import lru_cache
+from itertools import islice
 from typing import Any, Dict, List, Optional
 from urllib.parse import urlparse
 
+import numpy as np
+import pandas as pd
+
 # Tunables
 BRUTE_FORCE_WINDOW_SEC = 120
 BRUTE_FORCE_MIN_FAILS  = 10
@@ -16,30 +21,51 @@ RARE_UA_MIN_COUNT      = 2
 OFF_HOURS_START        = 0
 OFF_HOURS_END          = 5
 
-# Keyword recognizers for Auth0-like logs
-PASSWORD_RESET_RE = re.compile(
-    r"(password[\s_-]*(reset|change|changed|update|updated)|reset\s+password|pwd[\s_-]*reset|post-change-password|recovery\s+(email|ticket))",
-    re.I,
-)
-MFA_RE = re.compile(
-    r"\b(mfa|multi[-\s]?factor|guardian|otp|one[-\s]?time|webauthn|duo|push|factor|challenge|enroll|enrollment|recovery\s+code)\b",
+NS_PER_MIN = 60_000_000_000
+INT64_MIN = np.iinfo(np.int64).min                 # int64 view of NaT
+_NAT_MINUTE = INT64_MIN // NS_PER_MIN              # minute index of a missing timestamp
+
+# Keyword recognizers for Auth0-like logs (one pass; m.lastgroup tells which bucket matched)
+# Plain re on purpose: no nested quantifiers, so matching is already linear; google-re2
+# measured ~3x slower on these patterns, and its \s / \b are ASCII-only.
+PWD_MFA_RE = re.compile(
+    r"(?P<pwd>password[\s_-]*(reset|change|changed|update|updated)|reset\s+password|pwd[\s_-]*reset|post-change-password|recovery\s+(email|ticket))"
+    r"|\b(?P<mfa>mfa|multi[-\s]?factor|guardian|otp|one[-\s]?time|webauthn|duo|push|factor|challenge|enroll|enrollment|recovery\s+code)\b",
     re.I,
 )
+# "risk=<value>" hint surfaced by the Auth0 parser (value is whatever token follows)
+RISK_RE = re.compile(r"risk=\s*(\S*)")
+
+# Cheap substring screen; every PWD_MFA_RE alternative contains one of these
+PREFILTER = ("pass", "reset", "pwd", "mfa", "otp", "webauthn", "guardian", "duo",
+             "factor", "challenge", "enroll", "recovery", "one", "push")
+
+# With pyahocorasick the screen is a single Aho-Corasick pass over the text
+# instead of one substring scan per keyword; the regex still confirms hits.
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+if ahocorasick is not None:
+    _PREFILTER_AC = ahocorasick.Automaton()
+    for _kw in PREFILTER:
+        _PREFILTER_AC.add_word(_kw, _kw)
+    _PREFILTER_AC.make_automaton()
 
-def _freeze(x):
-    """Make nested dict/list/set hashable for de-duplication keys."""
-    if isinstance(x, dict):
-        return tuple(sorted((k, _freeze(v)) for k, v in x.items()))
-    if isinstance(x, (list, tuple)):
-        return tuple(_freeze(v) for v in x)
-    if isinstance(x, set):
-        return tuple(sorted(_freeze(v) for v in x))
-    return x
+    def _prefilter(text: str) -> bool:
+        return next(_PREFILTER_AC.iter(text), None) is not None
+else:
+    def _prefilter(text: str) -> bool:
+        return any(k in text for k in PREFILTER)
 
 def _as_dt(x: Any) -> Optional[datetime]:
     if x is None: return None
     if isinstance(x, datetime): return x
-    s = str(x).strip()
+    return _parse_dt(str(x).strip())
+
+@lru_cache(maxsize=8192)
+def _parse_dt(s: str) -> Optional[datetime]:
     try:
         if s.endswith(("Z","z")):
             return datetime.fromisoformat(s[:-1] + "+00:00")
@@ -56,13 +82,288 @@ def _as_int(x: Any) -> Optional[int]:
 
 def _host(url: Optional[str]) -> str:
     if not url: return ""
+    return _hostname(url)
+
+@lru_cache(maxsize=8192)
+def _hostname(url: str) -> str:
+    # Auth0 tenants hit a handful of hosts; skip re-parsing repeated URLs
     try: return urlparse(url).hostname or ""
     except Exception: return ""
 
-def _bucket_minute(ts: Optional[datetime]) -> str:
-    if not ts:
+def _bucket_minute(minute: int) -> str:
+    """Epoch-minute index -> ISO minute string (UTC); only called once per emitted bucket."""
+    if minute == _NAT_MINUTE:
         return "unknown"
-    return ts.replace(second=0, microsecond=0).isoformat()
+    return datetime.fromtimestamp(minute * 60, tz=timezone.utc).isoformat()
+
+def _bursts(keys: pd.Series, ts_ns: np.ndarray, window_ns: int, min_count: int) -> List[tuple]:
+    """
+    Sliding-window bursts over time-ordered events, per key.
+    Sorts by (key, ts) and walks a two-pointer window; a window of >= min_count
+    events within window_ns fires and restarts after its last event.
+    Returns [(fire_pos, positions)] ordered by firing time; positions index the input.
+    """
+    codes, _ = pd.factorize(keys)
+    order = np.argsort(codes, kind="stable")
+    k = codes[order].tolist()
+    t = ts_ns[order].tolist()
+    fires = []
+    left = 0
+    for right in range(len(t)):
+        if right and k[right] != k[right - 1]:
+            left = right
+        while t[right] - t[left] > window_ns:
+            left += 1
+        if right - left + 1 >= min_count:
+            fires.append((int(order[right]), order[left:right + 1]))
+            left = right + 1
+    fires.sort(key=lambda f: f[0])
+    return fires
+
+def _ids(values: np.ndarray, limit: int) -> List[int]:
+    """First `limit` present event ids (0 = missing) as plain ints, no intermediate lists."""
+    return values[values != 0][:limit].tolist()
+
+def _ts_ns(frame: pd.DataFrame) -> np.ndarray:
+    return frame["ts"].values.view("int64")
+
+# 0) Explicit password reset / MFA activity (bucketed by minute, user, ip)
+def _pwd_mfa_activity(ctx: Dict[str, Any]) -> List[Dict[str, Any]]:
+    df = ctx["df"]
+    out: List[Dict[str, Any]] = []
+    pwd_buckets: Dict[tuple, List[int]] = defaultdict(list)  # (minute_idx,user,ip) -> [event_id]
+    mfa_buckets: Dict[tuple, List[int]] = defaultdict(list)
+
+    # int64 epoch minutes (NaT -> _NAT_MINUTE); ISO strings are only built per bucket on emit
+    minutes = (df["ts"].values.view("int64") // NS_PER_MIN).tolist()
+    for ev, minute in zip(df.itertuples(index=False), minutes):
+        # raw (already lowercased) carries the original line; only rows without one
+        # (e.g. CSV) fall back to the joined structured fields
+        text = ev.raw or " ".join(
+            str(x) for x in [ev.action, ev.status, ev.url, ev.user_agent] if x
+        ).lower()
+        if not _prefilter(text):
+            continue
+        hits = {m.lastgroup for m in PWD_MFA_RE.finditer(text)}
+        if not hits:
+            continue
+
+        user   = ev.user.strip() or "<unknown>"
+        ip     = ev.src_ip.strip() or "<ip?>"
+
+        for kind in hits:
+            buckets = pwd_buckets if kind == "pwd" else mfa_buckets
+            if ev.event_id:
+                buckets[(minute, user, ip)].append(ev.event_id)
+            else:
+                buckets.setdefault((minute, user, ip), [])
+
+    for (minute, user, ip), ids in pwd_buckets.items():
+        out.append({
+            "reason": f"Password reset/change observed for {user}.",
+            "score": 0.65,
+            "kind": "auth.password_reset",
+            "meta": {"user": user, "src_ip": ip, "minute": _bucket_minute(minute), "event_ids": ids[:50]},
+        })
+
+    for (minute, user, ip), ids in mfa_buckets.items():
+        out.append({
+            "reason": f"MFA activity observed (enroll/challenge/reset) for {user}.",
+            "score": 0.55,
+            "kind": "auth.mfa_activity",
+            "meta": {"user": user, "src_ip": ip, "minute": _bucket_minute(minute), "event_ids": ids[:50]},
+        })
+    return out
+
+# 1) Brute force (many 401s in short window)
+def _brute_force(ctx: Dict[str, Any]) -> List[Dict[str, Any]]:
+    time_sorted = ctx["time_sorted"]
+    out: List[Dict[str, Any]] = []
+    fails = time_sorted[time_sorted["status"] == 401]
+    if fails.empty: return out
+    ts = _ts_ns(fails)
+    ids = fails["event_id"].to_numpy()
+    users = fails["user"].replace("", "<unknown>")
+    ips = fails["src_ip"].replace("", "<ip?>")
+    window_ns = BRUTE_FORCE_WINDOW_SEC * 1_000_000_000
+
+    for fire, pos in _bursts(users, ts, window_ns, BRUTE_FORCE_MIN_FAILS):
+        k_user = users.iat[fire]
+        out.append({
+            "reason": f"Brute-force suspected against user {k_user}",
+            "score": 0.95,
+            "kind": "auth.bruteforce_user",
+            "meta": {
+                "window_sec": BRUTE_FORCE_WINDOW_SEC,
+                "failures": len(pos),
+                "user": k_user,
+                "event_ids": _ids(ids[pos], 50),
+            },
+        })
+
+    for fire, pos in _bursts(users + "\x00" + ips, ts, window_ns, BRUTE_FORCE_MIN_FAILS):
+        k_pair = (users.iat[fire], ips.iat[fire])
+        out.append({
+            "reason": f"Brute-force suspected from {k_pair[1]} targeting {k_pair[0]}",
+            "score": 0.96,
+            "kind": "auth.bruteforce_pair",
+            "meta": {
+                "window_sec": BRUTE_FORCE_WINDOW_SEC,
+                "failures": len(pos),
+                "user": k_pair[0], "src_ip": k_pair[1],
+                "event_ids": _ids(ids[pos], 50),
+            },
+        })
+    return out
+
+# 2) Auth0 protection blocked
+def _blocked_protection(ctx: Dict[str, Any]) -> List[Dict[str, Any]]:
+    df = ctx["df"]
+    out: List[Dict[str, Any]] = []
+    raw = df["raw"]
+    mask = (df["status"] == 403) & (
+        raw.str.contains("brute-force", regex=False) | raw.str.contains("blocked", regex=False)
+    )
+    for ev in df[mask].itertuples(index=False):
+        out.append({
+            "reason": f"Auth0 protection blocked login (user={ev.user} ip={ev.src_ip})",
+            "score": 0.9,
+            "kind": "auth.blocked",
+            "meta": {"status": ev.status, "event_ids": [ev.event_id] if ev.event_id else []},
+        })
+    return out
+
+# 3) High-risk source (risk score / TOR)
+def _high_risk_source(ctx: Dict[str, Any]) -> List[Dict[str, Any]]:
+    df = ctx["df"]
+    out: List[Dict[str, Any]] = []
+    # "tor" also covers "tor_exit"
+    mask = df["raw"].str.contains("risk=", regex=False) | df["raw"].str.contains("tor", regex=False)
+    for ev in df[mask].itertuples(index=False):
+        m = RISK_RE.search(ev.raw)
+        if m:
+            try:
+                val = float(m.group(1).strip(" ;,"))
+            except ValueError:
+                val = 0.9
+            score = min(1.0, max(0.0, 0.85 + 0.15 * val))
+            out.append({
+                "reason": f"High-risk login source (user={ev.user} ip={ev.src_ip})",
+                "score": score,
+                "kind": "auth.high_risk",
+                "meta": {"risk": val, "event_ids": [ev.event_id] if ev.event_id else []},
+            })
+        else:
+            out.append({
+                "reason": f"Login from TOR-like source (user={ev.user} ip={ev.src_ip})",
+                "score": 0.88,
+                "kind": "auth.tor",
+                "meta": {"event_ids": [ev.event_id] if ev.event_id else []},
+            })
+    return out
+
+# 4) High error rate buckets
+def _high_error_rate(ctx: Dict[str, Any]) -> List[Dict[str, Any]]:
+    time_sorted = ctx["time_sorted"]
+    out: List[Dict[str, Any]] = []
+    if time_sorted.empty: return out
+
+    # one slim frame keyed by (user|host, bucket), stacked so a single groupby covers both
+    window_ns = ERROR_RATE_WINDOW_MIN * NS_PER_MIN
+    status = time_sorted["status"].to_numpy()
+    bucket = _ts_ns(time_sorted) // window_ns
+    is_err = ((status >= 400) & (status < 600)).astype(np.int8)
+    ids = time_sorted["event_id"].to_numpy()
+    n_ev = len(time_sorted)
+    keyed = pd.DataFrame({
+        "kind": np.repeat(["user", "host"], n_ev),
+        "who": np.concatenate([time_sorted["user"].to_numpy(), time_sorted["host"].to_numpy()]),
+        "bucket": np.tile(bucket, 2),
+        "is_err": np.tile(is_err, 2),
+        "event_id": np.tile(ids, 2),
+    })
+
+    grouped = keyed.groupby(["kind", "who", "bucket"], sort=False)
+    gid = grouped.ngroup()
+    stats = grouped.agg(n=("is_err", "size"), err=("is_err", "sum")).reset_index()
+    hot = stats[(stats["n"] >= ERROR_RATE_MIN_EVENTS) & (stats["err"] / stats["n"] >= ERROR_RATE_THRESHOLD)]
+    if hot.empty: return out
+
+    has_id = gid.isin(hot.index) & (keyed["event_id"] != 0)
+    first = keyed.loc[has_id, "event_id"].groupby(gid[has_id]).head(50)
+    ids_by_gid = first.groupby(gid[first.index]).agg(list)
+    for g, kind, who, n, errors in zip(hot.index, hot["kind"], hot["who"], hot["n"].tolist(), hot["err"].tolist()):
+        ratio = errors / max(1, n)
+        out.append({
+            "reason": f"High error rate ({ratio:.0%}) in 10-min window for {who}",
+            "score": 0.82 if ratio >= 0.8 else 0.75,
+            "kind": f"web.error_{kind}",
+            "meta": {
+                "events": n, "errors": errors,
+                "event_ids": ids_by_gid.get(g, []),
+            },
+        })
+    return out
+
+# 5) Rare UA
+def _rare_ua(ctx: Dict[str, Any]) -> List[Dict[str, Any]]:
+    ua_index = ctx["ua_index"]
+    out: List[Dict[str, Any]] = []
+    for ua, ids in ua_index.items():
+        n = len(ids)
+        if n >= RARE_UA_MIN_COUNT: continue
+        out.append({
+            "reason": f"Rare user-agent observed: '{ua}'",
+            "score": 0.62 if n == 1 else 0.58,
+            "kind": "web.rare_ua",
+            "meta": {"count": n, "event_ids": list(islice((x for x in ids if x), 10))},
+        })
+    return out
+
+# 6) Off-hours 00:00–05:59
+def _off_hours_logins(ctx: Dict[str, Any]) -> List[Dict[str, Any]]:
+    time_sorted = ctx["time_sorted"]
+    out: List[Dict[str, Any]] = []
+    mask = (time_sorted["status"] == 200) & time_sorted["hour"].between(OFF_HOURS_START, OFF_HOURS_END)
+    ids = _ids(time_sorted.loc[mask, "event_id"].to_numpy(), 50)
+    if ids:
+        out.append({
+            "reason": "Off-hours successful logins detected",
+            "score": 0.55,
+            "kind": "auth.offhours",
+            "meta": {"event_ids": ids},
+        })
+    return out
+
+# 7) Token exchange failures burst (/oauth/token 401)
+def _token_exchange_failures(ctx: Dict[str, Any]) -> List[Dict[str, Any]]:
+    time_sorted = ctx["time_sorted"]
+    out: List[Dict[str, Any]] = []
+    mask = (time_sorted["status"] == 401) & time_sorted["url"].str.contains("/oauth/token", regex=False)
+    hits = time_sorted[mask]
+    if hits.empty: return out
+    hosts = hits["host"].replace("", "<auth>")
+    ids = hits["event_id"].to_numpy()
+    for fire, pos in _bursts(hosts, _ts_ns(hits), 300 * 1_000_000_000, 15):
+        out.append({
+            "reason": f"Spike of token-exchange failures at {hosts.iat[fire]}",
+            "score": 0.8,
+            "kind": "auth.token_fail_burst",
+            "meta": {"window_sec": 300, "failures": len(pos),
+                    "event_ids": _ids(ids[pos], 50)},
+        })
+    return out
+
+DETECTORS = (
+    _pwd_mfa_activity,
+    _brute_force,
+    _blocked_protection,
+    _high_risk_source,
+    _high_error_rate,
+    _rare_ua,
+    _off_hours_logins,
+    _token_exchange_failures,
+)
 
 def detect_anomalies(events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     """
@@ -70,21 +371,34 @@ def detect_anomalies(events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         keys: ts, src_ip, user, url, action, status, bytes, user_agent, raw, (event_id or id)
     Output anomalies with rich meta (including event_ids):
         { reason, score, kind, meta: {event_ids: [...], ...} }
+
+    Events are normalized once into a column-oriented DataFrame; detectors work on
+    vectorized masks/groupbys over it. Timestamps are compared in UTC (naive = UTC),
+    except off-hours, which uses each event's local hour. event_id must be an int or
+    int-like string; anything else (or a missing id) is stored as 0 and left out of event_ids.
     """
     if not events: return []
 
     norm: List[Dict[str, Any]] = []
+    ua_index: Dict[str, List[Any]] = defaultdict(list)  # user_agent -> [event_id], first-seen order
     for e in events:
         # tolerate either "event_id" or "id" coming from the backend
         evid = e.get("event_id")
         if evid is None:
             evid = e.get("id")
+        if type(evid) is not int:
+            evid = _as_int(evid) or 0
+        ua = (e.get("user_agent") or "").strip()
+        if ua:
+            ua_index[ua].append(evid)
+        ts = _as_dt(e.get("ts"))
         norm.append({
-            "ts": _as_dt(e.get("ts")),
+            "ts": ts,
+            "hour": ts.hour if ts is not None else -1,  # wall-clock hour in the event's own offset
             "status": _as_int(e.get("status")),
             "src_ip": e.get("src_ip") or "",
             "user": e.get("user") or "",
-            "user_agent": (e.get("user_agent") or "").strip(),
+            "user_agent": ua,
             "action": (e.get("action") or "").strip().lower(),
             "url": e.get("url") or "",
             "host": _host(e.get("url")),
@@ -92,225 +406,32 @@ def detect_anomalies(events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
             "event_id": evid,
         })
 
-    ua_counts = Counter(ev["user_agent"] for ev in norm if ev["user_agent"])
-    time_sorted = sorted([ev for ev in norm if ev["ts"] is not None], key=lambda x: x["ts"])
-
-    anomalies: List[Dict[str, Any]] = []
-
-    # 0) Explicit password reset / MFA activity (bucketed by minute, user, ip)
-    def _pwd_mfa_activity():
-        pwd_buckets: Dict[tuple, List[int]] = defaultdict(list)  # (minute,user,ip) -> [event_id]
-        mfa_buckets: Dict[tuple, List[int]] = defaultdict(list)
-
-        for ev in norm:
-            text = " ".join(
-                str(x) for x in [
-                    ev.get("action",""),
-                    ev.get("status",""),
-                    ev.get("url",""),
-                    ev.get("user_agent",""),
-                    ev.get("raw",""),
-                ] if x
-            )
-            minute = _bucket_minute(ev.get("ts"))
-            user   = (ev.get("user") or "").strip() or "<unknown>"
-            ip     = (ev.get("src_ip") or "").strip() or "<ip?>"
-            evid   = ev.get("event_id")
-
-            if PASSWORD_RESET_RE.search(text):
-                if evid is not None:
-                    pwd_buckets[(minute, user, ip)].append(evid)
-                else:
-                    pwd_buckets.setdefault((minute, user, ip), [])
-
-            if MFA_RE.search(text):
-                if evid is not None:
-                    mfa_buckets[(minute, user, ip)].append(evid)
-                else:
-                    mfa_buckets.setdefault((minute, user, ip), [])
-
-        for (minute, user, ip), ids in pwd_buckets.items():
-            anomalies.append({
-                "reason": f"Password reset/change observed for {user}.",
-                "score": 0.65,
-                "kind": "auth.password_reset",
-                "meta": {"user": user, "src_ip": ip, "minute": minute, "event_ids": ids[:50]},
-            })
+    df = pd.DataFrame(norm)
+    # outside pandas' ns range (year 1 sentinels, 9999-12-31, typos) -> NaT, i.e. no timestamp
+    df["ts"] = pd.to_datetime(df["ts"], utc=True, errors="coerce")
+    df["status"] = pd.to_numeric(df["status"]).fillna(0).astype("int64")
+    df["event_id"] = df["event_id"].astype("int64")
 
-        for (minute, user, ip), ids in mfa_buckets.items():
-            anomalies.append({
-                "reason": f"MFA activity observed (enroll/challenge/reset) for {user}.",
-                "score": 0.55,
-                "kind": "auth.mfa_activity",
-                "meta": {"user": user, "src_ip": ip, "minute": minute, "event_ids": ids[:50]},
-            })
+    # one C-level stable argsort over int64 ns; NaT (INT64_MIN) sorts first and is cut off
+    ts_ns = _ts_ns(df)
+    order = np.argsort(ts_ns, kind="stable")
+    order = order[ts_ns[order] != INT64_MIN]
+    time_sorted = df.take(order)
 
-    # 1) Brute force (many 401s in short window)
-    def _brute_force():
-        win_user: Dict[str, deque] = defaultdict(deque)            # deque[(ts, id)]
-        win_pair: Dict[tuple, deque] = defaultdict(deque)          # deque[(ts, id)]
-        for ev in time_sorted:
-            if ev["status"] != 401: continue
-            t = ev["ts"]; eid = ev.get("event_id")
-            k_user = ev["user"] or "<unknown>"
-            k_pair = (ev["user"] or "<unknown>", ev["src_ip"] or "<ip?>")
-            for q in (win_user[k_user], win_pair[k_pair]):
-                q.append((t, eid))
-                while q and (t - q[0][0]).total_seconds() > BRUTE_FORCE_WINDOW_SEC:
-                    q.popleft()
-            if len(win_user[k_user]) >= BRUTE_FORCE_MIN_FAILS:
-                anomalies.append({
-                    "reason": f"Brute-force suspected against user {k_user}",
-                    "score": 0.95,
-                    "kind": "auth.bruteforce_user",
-                    "meta": {
-                        "window_sec": BRUTE_FORCE_WINDOW_SEC,
-                        "failures": len(win_user[k_user]),
-                        "user": k_user,
-                        "event_ids": [x[1] for x in list(win_user[k_user]) if x[1] is not None][:50],
-                    },
-                })
-                win_user[k_user].clear()
-            if len(win_pair[k_pair]) >= BRUTE_FORCE_MIN_FAILS:
-                anomalies.append({
-                    "reason": f"Brute-force suspected from {k_pair[1]} targeting {k_pair[0]}",
-                    "score": 0.96,
-                    "kind": "auth.bruteforce_pair",
-                    "meta": {
-                        "window_sec": BRUTE_FORCE_WINDOW_SEC,
-                        "failures": len(win_pair[k_pair]),
-                        "user": k_pair[0], "src_ip": k_pair[1],
-                        "event_ids": [x[1] for x in list(win_pair[k_pair]) if x[1] is not None][:50],
-                    },
-                })
-                win_pair[k_pair].clear()
-
-    # 2) Auth0 protection blocked
-    def _blocked_protection():
-        for ev in norm:
-            if ev["status"] == 403 and ("brute-force" in ev["raw"] or "blocked" in ev["raw"]):
-                anomalies.append({
-                    "reason": f"Auth0 protection blocked login (user={ev['user']} ip={ev['src_ip']})",
-                    "score": 0.9,
-                    "kind": "auth.blocked",
-                    "meta": {"status": ev["status"], "event_ids": [ev["event_id"]] if ev.get("event_id") else []},
-                })
-
-    # 3) High-risk source (risk score / TOR)
-    def _high_risk_source():
-        for ev in norm:
-            raw = ev["raw"]
-            if "risk=" in raw:
-                try:
-                    frag = raw.split("risk=", 1)[1]
-                    val = float(frag.split()[0].strip(" ;,"))
-                except Exception:
-                    val = 0.9
-                score = min(1.0, max(0.0, 0.85 + 0.15 * val))
-                anomalies.append({
-                    "reason": f"High-risk login source (user={ev['user']} ip={ev['src_ip']})",
-                    "score": score,
-                    "kind": "auth.high_risk",
-                    "meta": {"risk": val, "event_ids": [ev["event_id"]] if ev.get("event_id") else []},
-                })
-            elif "tor" in raw or "tor_exit" in raw:
-                anomalies.append({
-                    "reason": f"Login from TOR-like source (user={ev['user']} ip={ev['src_ip']})",
-                    "score": 0.88,
-                    "kind": "auth.tor",
-                    "meta": {"event_ids": [ev["event_id"]] if ev.get("event_id") else []},
-                })
-
-    # 4) High error rate buckets
-    def _high_error_rate():
-        by_bucket: Dict[tuple, List[Dict[str, Any]]] = defaultdict(list)
-        for ev in time_sorted:
-            b = ev["ts"].replace(second=0, microsecond=0)
-            b = b - timedelta(minutes=b.minute % ERROR_RATE_WINDOW_MIN)
-            by_bucket[("user", ev["user"], b)].append(ev)
-            by_bucket[("host", ev["host"], b)].append(ev)
-
-        for (kind, who, b), lst in by_bucket.items():
-            if len(lst) < ERROR_RATE_MIN_EVENTS: continue
-            errors = sum(1 for x in lst if x["status"] and 400 <= x["status"] < 600)
-            ratio = errors / max(1, len(lst))
-            if ratio >= ERROR_RATE_THRESHOLD:
-                anomalies.append({
-                    "reason": f"High error rate ({ratio:.0%}) in 10-min window for {who}",
-                    "score": 0.82 if ratio >= 0.8 else 0.75,
-                    "kind": f"web.error_{kind}",
-                    "meta": {
-                        "events": len(lst), "errors": errors,
-                        "event_ids": [e["event_id"] for e in lst if e.get("event_id")][:50],
-                    },
-                })
-
-    # 5) Rare UA
-    def _rare_ua():
-        seen = set()
-        for ev in norm:
-            ua = ev["user_agent"]
-            if not ua or ua in seen: continue
-            if ua_counts[ua] < RARE_UA_MIN_COUNT:
-                ids = [e.get("event_id") for e in norm if e["user_agent"] == ua and e.get("event_id")][:10]
-                anomalies.append({
-                    "reason": f"Rare user-agent observed: '{ua}'",
-                    "score": 0.62 if ua_counts[ua] == 1 else 0.58,
-                    "kind": "web.rare_ua",
-                    "meta": {"count": ua_counts[ua], "event_ids": ids},
-                })
-                seen.add(ua)
-
-    # 6) Off-hours 00:00–05:59
-    def _off_hours_logins():
-        ids = []
-        for ev in time_sorted:
-            if ev["status"] == 200 and ev["ts"] is not None:
-                if OFF_HOURS_START <= ev["ts"].hour <= OFF_HOURS_END:
-                    if ev.get("event_id"): ids.append(ev["event_id"])
-        if ids:
-            anomalies.append({
-                "reason": "Off-hours successful logins detected",
-                "score": 0.55,
-                "kind": "auth.offhours",
-                "meta": {"event_ids": ids[:50]},
-            })
+    ctx = {"df": df, "time_sorted": time_sorted, "ua_index": ua_index}
+
+    # Run passes (each detector only reads ctx)
+    anomalies = [a for detect in DETECTORS for a in detect(ctx)]
 
-    # 7) Token exchange failures burst (/oauth/token 401)
-    def _token_exchange_failures():
-        win: Dict[str, deque] = defaultdict(deque)  # host -> deque[(ts,id)]
-        for ev in time_sorted:
-            if ev["status"] != 401: continue
-            if "/oauth/token" not in (ev["url"] or ""): continue
-            host = ev["host"] or "<auth>"
-            t = ev["ts"]; eid = ev.get("event_id")
-            q = win[host]; q.append((t, eid))
-            while q and (t - q[0][0]).total_seconds() > 300:
-                q.popleft()
-            if len(q) >= 15:
-                anomalies.append({
-                    "reason": f"Spike of token-exchange failures at {host}",
-                    "score": 0.8,
-                    "kind": "auth.token_fail_burst",
-                    "meta": {"window_sec": 300, "failures": len(q),
-                            "event_ids": [x[1] for x in list(q) if x[1] is not None][:50]},
-                })
-                q.clear()
-
-    # Run passes
-    _pwd_mfa_activity()
-    _brute_force()
-    _blocked_protection()
-    _high_risk_source()
-    _high_error_rate()
-    _rare_ua()
-    _off_hours_logins()
-    _token_exchange_failures()
-
-    # de-dupe identical reasons/meta
+    # de-dupe identical reasons/meta; emitters write flat metas (scalars + an event_ids list),
+    # so the key is built directly instead of recursively freezing the dict
     seen, unique = set(), []
     for a in anomalies:
-        key = (a.get("kind"), a.get("reason"), _freeze(a.get("meta") or {}))
+        meta = a.get("meta") or {}
+        key = (
+            a.get("kind"), a.get("reason"), tuple(meta.get("event_ids") or ()),
+            tuple((k, v) for k, v in meta.items() if k != "event_ids"),
+        )
         if key in seen:
             continue
         seen.add(key)
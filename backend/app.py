@@ -1,20 +1,49 @@
+import hashlib
 import os
 import time
 import threading
 import traceback
+from contextlib import nullcontext
 from datetime import datetime, timezone
+from itertools import islice
+import numpy as np
+import pandas as pd
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-from sqlalchemy import select, text
+from sqlalchemy import delete, select, text
+from sqlalchemy.orm import undefer, undefer_group
 from db import Base, engine, SessionLocal
 from models import Upload, LogEvent, Anomaly
-from parser import parse_csv, parse_fallback_lines, parse_auth0_jsonl
+from parser import Row, parse_csv, parse_fallback_lines, parse_auth0_jsonl
 from anomaly import detect_anomalies
 from auth import login_handler, require_auth
-from summarizer import summarize_anomaly, summarize_log  # NEW
+from summarizer import overall_model, summarize_anomaly, summarize_log  # NEW
 
 app = Flask(__name__)
 
+# rows per bulk INSERT while loading parsed events
+INSERT_BATCH = 5000
+# LogEvent rows fetched per round trip when reading an upload back
+EVENT_BATCH = 2000
+
+def _upload_dir() -> str:
+    """
+    Where raw upload bodies are written (one file per upload). They must outlive the
+    container: on Railway the default is the attached volume, and startup fails if
+    there is none (a redeploy would drop bodies of uploads not yet analysed).
+    """
+    volume = os.getenv("RAILWAY_VOLUME_MOUNT_PATH")
+    default = os.path.join(volume, "uploads") if volume else os.path.join(os.path.dirname(os.path.abspath(__file__)), "uploads")
+    path = os.path.abspath(os.getenv("UPLOAD_DIR") or default)
+    if os.getenv("RAILWAY_ENVIRONMENT_NAME") or os.getenv("RAILWAY_ENVIRONMENT"):
+        if not volume or os.path.commonpath([path, os.path.abspath(volume)]) != os.path.abspath(volume):
+            raise RuntimeError(
+                f"UPLOAD_DIR={path} is not on a Railway volume; attach a volume to the backend service"
+            )
+    return path
+
+UPLOAD_DIR = _upload_dir()
+
 # ---------- Async DB warmup so the server can start immediately ----------
 DB_READY = False
 
@@ -41,6 +70,46 @@ def ensure_db_async(max_attempts: int = 60, delay: float = 1.5):
                         ADD COLUMN IF NOT EXISTS ai_summary_at TIMESTAMPTZ
                     """))
 
+                # columns used for the cached analysis output (idempotent)
+                with engine.begin() as conn:
+                    conn.execute(text("""
+                        ALTER TABLE uploads
+                        ADD COLUMN IF NOT EXISTS anomaly_groups_json JSONB,
+                        ADD COLUMN IF NOT EXISTS timeline_json JSONB
+                    """))
+
+                # raw upload bodies now live on disk (idempotent)
+                with engine.begin() as conn:
+                    conn.execute(text("""
+                        ALTER TABLE uploads
+                        ADD COLUMN IF NOT EXISTS raw_path VARCHAR(512),
+                        ADD COLUMN IF NOT EXISTS raw_bytes BIGINT
+                    """))
+                    # widen columns first added as INTEGER; ALTER TYPE takes an ACCESS EXCLUSIVE
+                    # lock even as a no-op, so only run it while the column is still integer
+                    raw_bytes_type = conn.execute(text("""
+                        SELECT data_type FROM information_schema.columns
+                        WHERE table_schema = current_schema()
+                          AND table_name = 'uploads' AND column_name = 'raw_bytes'
+                    """)).scalar()
+                    if raw_bytes_type == "integer":
+                        conn.execute(text("ALTER TABLE uploads ALTER COLUMN raw_bytes TYPE BIGINT"))
+
+                # content hash for reusing summaries of identical uploads (idempotent)
+                with engine.begin() as conn:
+                    conn.execute(text("""
+                        ALTER TABLE uploads
+                        ADD COLUMN IF NOT EXISTS content_sha256 VARCHAR(64)
+                    """))
+                    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_uploads_sha256_summary_at ON uploads (content_sha256, ai_summary_at)"))
+
+                # per-upload event reads must be index scans; create_all() only
+                # creates indexes together with new tables, so ensure them here too
+                with engine.begin() as conn:
+                    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_log_events_upload_id ON log_events (upload_id)"))
+                    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_log_events_upload_ts ON log_events (upload_id, ts)"))
+                    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_log_events_ts_brin ON log_events USING brin (ts) WITH (pages_per_range = 32)"))
+
                 app.logger.info("✅ Database ready; tables/columns ensured.")
                 DB_READY = True
                 return
@@ -97,30 +166,148 @@ def _norm_ts(s: str | None):
     except Exception:
         return None
 
+def _count(v) -> int | None:
+    """status/bytes cell: ints from typed parsers pass through, digit strings are parsed."""
+    if type(v) is int:
+        return v if v >= 0 else None
+    return int(v) if str(v or "").isdigit() else None
+
+def _event_mapping(upload_id: int, r: dict | Row) -> dict:
+    """Parsed row -> LogEvent column mapping (for bulk inserts)."""
+    if type(r) is Row:
+        # fixed schema: no alternate keys to probe
+        return {
+            "upload_id": upload_id,
+            "ts": _norm_ts(r.time),
+            "src_ip": r.src_ip or None,
+            "user": r.user or None,
+            "url": r.url or None,
+            "action": r.action,
+            "status": _count(r.status),
+            "bytes": _count(r.bytes),
+            "user_agent": r.user_agent or None,
+            "raw": r.raw or None,
+        }
+    ts = None
+    for key in ("time","timestamp","ts"):
+        ts = _norm_ts(r.get(key))
+        if ts: break
+    return {
+        "upload_id": upload_id,
+        "ts": ts,
+        "src_ip": r.get("src_ip") or r.get("srcip") or r.get("client_ip"),
+        "user": r.get("user") or r.get("username"),
+        "url": r.get("url") or r.get("host") or None,
+        "action": r.get("action"),
+        "status": _count(r.get("status")),
+        "bytes": _count(r.get("bytes")),
+        "user_agent": r.get("user_agent") or r.get("ua") or None,
+        "raw": r.get("raw") or None,
+    }
+
+def bulk_insert_events(session, upload_id: int, rows, on_batch=None) -> int:
+    """
+    Insert parsed rows as LogEvents, INSERT_BATCH rows per Core executemany (no ORM
+    unit of work / identity map). Each batch is committed, then on_batch(inserted) runs.
+    """
+    stmt = LogEvent.__table__.insert()
+    mappings = (_event_mapping(upload_id, r) for r in rows)
+    inserted = 0
+    while True:
+        chunk = list(islice(mappings, INSERT_BATCH))
+        if not chunk:
+            break
+        session.execute(stmt, chunk)
+        session.commit()
+        inserted += len(chunk)
+        if on_batch:
+            on_batch(inserted)
+    return inserted
+
 EXPECTED_KEYS = {"time","timestamp","ts","src_ip","srcip","client_ip","user","status","url"}
 
-def smart_parse(raw_content: str, filename: str = ""):
-    txt = (raw_content or "").lstrip()
+class FormatMismatch(Exception):
+    """A lazily parsed upload failed partway through in the format smart_parse picked."""
+    def __init__(self, fmt: str):
+        super().__init__(fmt)
+        self.fmt = fmt
+
+def _format_checked(head, rows, fmt: str):
+    try:
+        yield from head
+        yield from rows
+    except Exception as e:
+        raise FormatMismatch(fmt) from e
+
+def smart_parse(raw_content, filename: str = "", skip=()):
+    """
+    raw_content: the full text, or a seekable text file (rewound before each parse attempt).
+    Returns (rows, fmt) where rows is a lazy iterator; formats are picked on their first row,
+    so a later parse error raises FormatMismatch and the caller retries with fmt in skip.
+    """
+    def src():
+        if not isinstance(raw_content, str):
+            raw_content.seek(0)
+        return raw_content
+
+    def jsonl_src():
+        # files are handed over as their binary buffer: orjson parses the UTF-8 bytes
+        # directly instead of decoding to str and re-encoding
+        f = src()
+        return getattr(f, "buffer", f)
+
+    head = raw_content[:4096] if isinstance(raw_content, str) else src().read(4096)
+    txt = (head or "").lstrip()
     looks_jsonl = filename.lower().endswith(".jsonl") or (txt.startswith("{") or txt.startswith("["))
-    if looks_jsonl:
+    if looks_jsonl and "auth0-jsonl" not in skip:
         try:
-            rows = parse_auth0_jsonl(raw_content)
-            return rows, "auth0-jsonl"
+            rows = parse_auth0_jsonl(jsonl_src())
+            first = list(islice(rows, 1))
+            return _format_checked(first, rows, "auth0-jsonl"), "auth0-jsonl"
         except Exception:
             pass
-    try:
-        rows = parse_csv(raw_content)
-        good = sum(1 for r in rows if EXPECTED_KEYS.intersection(r.keys()))
-        if good >= max(1, int(0.3 * max(1, len(rows)))):
-            return rows, "csv"
-    except Exception:
-        pass
-    try:
-        rows = parse_auth0_jsonl(raw_content)
-        return rows, "auth0-jsonl"
-    except Exception:
-        pass
-    return parse_fallback_lines(raw_content), "fallback"
+    if "csv" not in skip:
+        try:
+            # every CSV row carries the header's keys, so the first row decides
+            rows = parse_csv(src())
+            first = list(islice(rows, 1))
+            if first and EXPECTED_KEYS.intersection(first[0].keys()):
+                return _format_checked(first, rows, "csv"), "csv"
+        except Exception:
+            pass
+    if "auth0-jsonl" not in skip:
+        try:
+            rows = parse_auth0_jsonl(jsonl_src())
+            first = list(islice(rows, 1))
+            return _format_checked(first, rows, "auth0-jsonl"), "auth0-jsonl"
+        except Exception:
+            pass
+    return parse_fallback_lines(src()), "fallback"
+
+def _open_raw(u):
+    """Context manager yielding an upload's raw log: the stored file, or legacy inline raw_content."""
+    if u.raw_path:
+        return open(u.raw_path, "r", encoding="utf-8", errors="ignore", newline="")
+    return nullcontext(u.raw_content or "")
+
+def _raw_size(u) -> int:
+    return u.raw_bytes if u.raw_bytes is not None else os.path.getsize(u.raw_path)
+
+def _reusable_summary(dbsess, u):
+    """(ai_summary, ai_summary_model) cached for an identical earlier upload by the current model, or None."""
+    if not u.content_sha256:
+        return None
+    return dbsess.execute(
+        select(Upload.ai_summary, Upload.ai_summary_model)
+        .where(
+            Upload.content_sha256 == u.content_sha256,
+            Upload.ai_summary.isnot(None),
+            Upload.ai_summary_model == overall_model(),
+            Upload.id != u.id,
+        )
+        .order_by(Upload.ai_summary_at.desc())
+        .limit(1)
+    ).first()
 
 def _group_anomalies(rich_anoms, id_to_event):
     """
@@ -168,57 +355,86 @@ def _group_anomalies(rich_anoms, id_to_event):
     out.sort(key=lambda x: x["count"], reverse=True)
     return out
 
+def _timeline_points(timestamps):
+    """Simple per-minute timeline (counts only); buckets are epoch-minute ints, formatted once (UTC)."""
+    # stamps outside pandas' ns range (year 1, 9999-12-31) become NaT and are left out, like missing ones
+    ts = pd.to_datetime(list(timestamps), utc=True, errors="coerce")
+    ns = ts[ts.notna()].values.view("int64")
+    minutes, counts = np.unique(ns // 60_000_000_000, return_counts=True)
+    return [
+        {"minute": datetime.fromtimestamp(m * 60, tz=timezone.utc).isoformat(), "count": c}
+        for m, c in zip(minutes.tolist(), counts.tolist())
+    ]
+
+def _iter_events(dbsess, upload_id: int):
+    """Stream an upload's LogEvents in yield_per batches instead of loading them all at once."""
+    stmt = (
+        select(LogEvent)
+        .where(LogEvent.upload_id == upload_id)
+        .execution_options(yield_per=EVENT_BATCH)
+    )
+    for batch in dbsess.execute(stmt).scalars().partitions():
+        yield from batch
+
+def _event_json(e) -> dict:
+    """LogEvent -> API/sample dict."""
+    return {
+        "id": e.id,
+        "ts": e.ts.isoformat() if e.ts else None,
+        "src_ip": e.src_ip, "user": e.user, "url": e.url,
+        "action": e.action, "status": e.status, "bytes": e.bytes,
+        "user_agent": e.user_agent, "raw": e.raw
+    }
+
+def _detect_input(e) -> dict:
+    """LogEvent -> detect_anomalies input dict."""
+    return {
+        "event_id": e.id,
+        "ts": e.ts, "src_ip": e.src_ip, "user": e.user,
+        "url": e.url, "action": e.action, "status": e.status,
+        "user_agent": e.user_agent, "raw": e.raw
+    }
+
 def _process_analysis(upload_id: int):
     """Background analysis worker: parse -> insert events -> detect + group -> (optional) LLM overall summary."""
     dbt = SessionLocal()
     try:
-        u = dbt.get(Upload, upload_id)
-        if not u or not u.raw_content:
+        u = dbt.get(Upload, upload_id, options=[undefer(Upload.raw_content)])
+        if not u or not (u.raw_content or (u.raw_path and _raw_size(u))):
             set_state(dbt, upload_id, status="failed", progress=100)
             return
 
         set_state(dbt, upload_id, status="processing", progress=5)
 
-        rows, fmt = smart_parse(u.raw_content or "", getattr(u, "filename", ""))
-        app.logger.info(f"[upload {upload_id}] parsed {len(rows)} rows as {fmt}")
-        set_state(dbt, upload_id, progress=15)
-
-        total = len(rows) or 1
-        inserted = 0
-        for r in rows:
-            ts = None
-            for key in ("time","timestamp","ts"):
-                ts = _norm_ts(r.get(key))
-                if ts: break
-            ev = LogEvent(
-                upload_id=upload_id,
-                ts=ts,
-                src_ip=r.get("src_ip") or r.get("srcip") or r.get("client_ip"),
-                user=r.get("user") or r.get("username"),
-                url=r.get("url") or r.get("host") or None,
-                action=r.get("action"),
-                status=(int(r.get("status")) if str(r.get("status") or "").isdigit() else None),
-                bytes=int(r.get("bytes") or 0) if str(r.get("bytes") or "").isdigit() else None,
-                user_agent=r.get("user_agent") or r.get("ua") or None,
-                raw=r.get("raw") or None,
-            )
-            dbt.add(ev)
-            inserted += 1
-            if inserted % 500 == 0:
-                dbt.commit()
-                prog = 15 + int(55 * (inserted / total))
-                set_state(dbt, upload_id, progress=min(70, prog))
-        dbt.commit()
+        # parsing is pipelined into the batched inserts; progress follows the file offset
+        size = _raw_size(u) if u.raw_path else 0
+        skip = set()
+        while True:
+            with _open_raw(u) as raw:
+                rows, fmt = smart_parse(raw, getattr(u, "filename", ""), skip)
+                set_state(dbt, upload_id, progress=15)
+                def _inserted(n):
+                    buf = getattr(raw, "buffer", None)
+                    done = buf.tell() / size if buf is not None and size else 1
+                    set_state(dbt, upload_id, progress=min(70, 15 + int(55 * done)))
+                try:
+                    inserted = bulk_insert_events(dbt, upload_id, rows, on_batch=_inserted)
+                    break
+                except FormatMismatch as e:
+                    # bad row past the sniffed head: drop what was stored, try the next format
+                    app.logger.info(f"[upload {upload_id}] not {e.fmt} after all ({e.__cause__!r}); re-parsing")
+                    dbt.rollback()
+                    dbt.execute(delete(LogEvent).where(LogEvent.upload_id == upload_id))
+                    dbt.commit()
+                    skip.add(e.fmt)
+        app.logger.info(f"[upload {upload_id}] parsed {inserted} rows as {fmt}")
         set_state(dbt, upload_id, progress=75)
 
         # Detect anomalies (light store)
-        evs = dbt.execute(select(LogEvent).where(LogEvent.upload_id == upload_id)).scalars().all()
-        ev_dicts = [{
-            "event_id": e.id,
-            "ts": e.ts, "src_ip": e.src_ip, "user": e.user,
-            "url": e.url, "action": e.action, "status": e.status,
-            "user_agent": e.user_agent, "raw": e.raw
-        } for e in evs]
+        ev_dicts, id_to_event = [], {}
+        for e in _iter_events(dbt, upload_id):
+            ev_dicts.append(_detect_input(e))
+            id_to_event[e.id] = _event_json(e)
         found = detect_anomalies(ev_dicts)
 
         for a in found:
@@ -228,45 +444,56 @@ def _process_analysis(upload_id: int):
         dbt.commit()
 
         # ---- Summarizing (single LLM call per upload) ----
-        id_to_event = {e.id: {
-            "id": e.id,
-            "ts": e.ts.isoformat() if e.ts else None,
-            "src_ip": e.src_ip, "user": e.user, "url": e.url,
-            "action": e.action, "status": e.status, "bytes": e.bytes,
-            "user_agent": e.user_agent, "raw": e.raw
-        } for e in evs}
         grouped = _group_anomalies(found, id_to_event)
 
         # Simple per-minute timeline (counts only) for context
-        from collections import Counter
-        timeline = Counter()
-        for e in evs:
-            if e.ts:
-                minute = e.ts.replace(second=0, microsecond=0).isoformat()
-                timeline[minute] += 1
-        timeline_points = [{"minute": k, "count": v} for k, v in sorted(timeline.items())]
+        timeline_points = _timeline_points(d["ts"] for d in ev_dicts)
+
+        # Cache grouped output so /api/analysis doesn't re-run detection per GET
+        try:
+            u = dbt.get(Upload, upload_id)
+            u.anomaly_groups_json = grouped
+            u.timeline_json = timeline_points
+            dbt.add(u)
+            dbt.commit()
+        except Exception as e:
+            dbt.rollback()
+            app.logger.warning(f"Analysis cache skipped (columns not ready?): {e}")
 
         # Show UI progress during LLM call
         set_state(dbt, upload_id, status="summarizing", progress=88)
 
         try:
-            ai_text = summarize_log(
-                context={
-                    "filename": u.filename,
-                    "created_at": u.created_at.isoformat() if u.created_at else None,
-                    "counts": {"events": len(evs), "anomalies": len(found), "groups": len(grouped)},
-                },
-                groups=grouped,
-                timeline=timeline_points[-60:],  # last 60 points for brevity
-            )
+            # same bytes were summarized before -> copy that instead of another LLM call
+            if u.content_sha256 is None and u.raw_content:
+                u.content_sha256 = hashlib.sha256(u.raw_content.encode("utf-8")).hexdigest()
+            reused = _reusable_summary(dbt, u)
         except Exception:
-            ai_text = None
+            dbt.rollback()
+            reused = None
+        if reused:
+            ai_text, ai_model = reused
+            app.logger.info(f"[upload {upload_id}] reused summary of identical content")
+        else:
+            try:
+                # ai_model stays None for rule-based text, so it is never reused for identical uploads
+                ai_text, ai_model = summarize_log(
+                    context={
+                        "filename": u.filename,
+                        "created_at": u.created_at.isoformat() if u.created_at else None,
+                        "counts": {"events": len(ev_dicts), "anomalies": len(found), "groups": len(grouped)},
+                    },
+                    groups=grouped,
+                    timeline=timeline_points[-60:],  # last 60 points for brevity
+                )
+            except Exception:
+                ai_text, ai_model = None, None
 
         # Cache the overall summary (guard if columns not ready yet)
         try:
             u = dbt.get(Upload, upload_id)
             u.ai_summary = ai_text
-            u.ai_summary_model = os.getenv("LLM_MODEL")
+            u.ai_summary_model = ai_model
             u.ai_summary_at = datetime.now(timezone.utc)
             dbt.add(u)
             dbt.commit()
@@ -301,20 +528,44 @@ def upload():
     if "file" not in request.files:
         return {"error": "no file"}, 400
     up_file = request.files["file"]
-    content = up_file.read().decode(errors="ignore")
 
     db = SessionLocal()
-    up = Upload(
-        filename=up_file.filename,
-        status="uploaded",
-        progress=0,
-        raw_content=content,
-    )
-    db.add(up)
-    db.commit()
-    db.refresh(up)
-    upload_id = up.id
-    db.close()
+    try:
+        up = Upload(
+            filename=up_file.filename,
+            status="uploaded",
+            progress=0,
+        )
+        db.add(up)
+        db.commit()
+        db.refresh(up)
+        upload_id = up.id
+
+        # stream the body to disk (hashing it on the way); the row only keeps the path
+        raw_path = os.path.join(UPLOAD_DIR, f"{upload_id}.log")
+        try:
+            os.makedirs(UPLOAD_DIR, exist_ok=True)
+            digest, size = hashlib.sha256(), 0
+            with open(raw_path, "wb") as fh:
+                for chunk in iter(lambda: up_file.stream.read(1 << 20), b""):
+                    digest.update(chunk)
+                    fh.write(chunk)
+                    size += len(chunk)
+        except Exception:
+            # don't leave a row (or a partial file) behind for a body that was never stored
+            db.rollback()
+            db.delete(up)
+            db.commit()
+            if os.path.exists(raw_path):
+                os.remove(raw_path)
+            raise
+        up.raw_path = raw_path
+        up.content_sha256 = digest.hexdigest()
+        up.raw_bytes = size
+        db.add(up)
+        db.commit()
+    finally:
+        db.close()
     return {"upload_id": upload_id, "status": "uploaded", "progress": 0}, 200
 
 @app.route("/api/analyze/<int:upload_id>", methods=["OPTIONS"])
@@ -357,7 +608,7 @@ def status(upload_id: int):
 @require_auth
 def analysis(upload_id: int):
     db = SessionLocal()
-    up = db.get(Upload, upload_id)
+    up = db.get(Upload, upload_id, options=[undefer_group("analysis")])
     if not up:
         db.close()
         return {"error": "not found"}, 404
@@ -371,35 +622,20 @@ def analysis(upload_id: int):
         db.close()
         return jsonify(data), 202
 
-    evs = db.execute(select(LogEvent).where(LogEvent.upload_id == upload_id)).scalars().all()
-
-    # Timeline
-    from collections import Counter
-    timeline = Counter()
-    for e in evs:
-        if e.ts:
-            minute = e.ts.replace(second=0, microsecond=0).isoformat()
-            timeline[minute] += 1
-    timeline_points = [{"minute": k, "count": v} for k, v in sorted(timeline.items())]
-
     # id -> event dict
-    id_to_event = {e.id: {
-        "id": e.id,
-        "ts": e.ts.isoformat() if e.ts else None,
-        "src_ip": e.src_ip, "user": e.user, "url": e.url,
-        "action": e.action, "status": e.status, "bytes": e.bytes,
-        "user_agent": e.user_agent, "raw": e.raw
-    } for e in evs}
-
-    # Recompute rich anomalies to get event_ids
-    ev_dicts = [{
-        "event_id": e.id,
-        "ts": e.ts, "src_ip": e.src_ip, "user": e.user,
-        "url": e.url, "action": e.action, "status": e.status,
-        "user_agent": e.user_agent, "raw": e.raw
-    } for e in evs]
-    rich_anoms = detect_anomalies(ev_dicts)
-    grouped = _group_anomalies(rich_anoms, id_to_event)
+    id_to_event = {e["id"]: e for e in map(_event_json, _iter_events(db, upload_id))}
+
+    # Cached by the worker; uploads analysed before the cache existed fall back to recomputing
+    timeline_points = getattr(up, "timeline_json", None)
+    grouped = getattr(up, "anomaly_groups_json", None)
+    if timeline_points is None or grouped is None:
+        ev_dicts = [_detect_input(e) for e in _iter_events(db, upload_id)]
+        if timeline_points is None:
+            timeline_points = _timeline_points(d["ts"] for d in ev_dicts)
+        if grouped is None:
+            # Recompute rich anomalies to get event_ids
+            rich_anoms = detect_anomalies(ev_dicts)
+            grouped = _group_anomalies(rich_anoms, id_to_event)
 
     data = {
         "upload": {"id": up.id, "filename": up.filename, "created_at": up.created_at.isoformat()},
@@ -417,18 +653,52 @@ def analysis(upload_id: int):
 @require_auth
 def list_uploads():
     db = SessionLocal()
-    ups = db.execute(select(Upload).order_by(Upload.created_at.desc())).scalars().all()
+    # plain columns plus a SQL has_summary flag: no summary or cache payloads are loaded
+    has_summary = (Upload.ai_summary.isnot(None) & (Upload.ai_summary != "")).label("has_summary")
+    ups = db.execute(
+        select(
+            Upload.id, Upload.filename, Upload.created_at, Upload.status,
+            Upload.progress, Upload.raw_bytes, has_summary,
+        ).order_by(Upload.created_at.desc())
+    ).all()
     data = [{
         "id": u.id,
         "filename": u.filename,
         "created_at": u.created_at.isoformat(),
         "status": (u.status or "uploaded"),
         "progress": (u.progress or 0),
-        "has_summary": bool(getattr(u, "ai_summary", None)),
+        "has_summary": bool(u.has_summary),
+        "raw_bytes": u.raw_bytes,
     } for u in ups]
     db.close()
     return jsonify(data)
 
+@app.cli.command("backfill-raw")
+def backfill_raw():
+    """Move legacy inline raw_content bodies into UPLOAD_DIR files (one-shot; safe to re-run)."""
+    db = SessionLocal()
+    moved = 0
+    try:
+        os.makedirs(UPLOAD_DIR, exist_ok=True)
+        ids = db.execute(
+            select(Upload.id).where(Upload.raw_path.is_(None), Upload.raw_content.isnot(None))
+        ).scalars().all()
+        for uid in ids:
+            u = db.get(Upload, uid, options=[undefer(Upload.raw_content)])
+            data = u.raw_content.encode("utf-8")
+            path = os.path.join(UPLOAD_DIR, f"{uid}.log")
+            with open(path, "wb") as fh:
+                fh.write(data)
+            u.raw_path, u.raw_bytes = path, len(data)
+            u.content_sha256 = u.content_sha256 or hashlib.sha256(data).hexdigest()
+            u.raw_content = None
+            db.commit()
+            db.expunge(u)  # drop the body from the identity map before the next one
+            moved += 1
+    finally:
+        db.close()
+    print(f"moved {moved} upload bodies to {UPLOAD_DIR}")
+
 if __name__ == "__main__":
     port = int(os.getenv("PORT", "8000"))
     app.run(host="0.0.0.0", port=port, threaded=True)
@@ -1,7 +1,7 @@
-import os, time, hashlib
+import os, time, hashlib, math
 import jwt
 from flask import request, jsonify
-from functools import wraps
+from functools import wraps, lru_cache
 
 SECRET_KEY = os.getenv("SECRET_KEY", "devsecret")
 DEMO_USERNAME = os.getenv("DEMO_USERNAME", "admin")
@@ -11,6 +11,12 @@ def create_token(username: str):
     payload = {"sub": username, "iat": int(time.time()), "exp": int(time.time()) + 60*60*12}
     return jwt.encode(payload, SECRET_KEY, algorithm="HS256")
 
+@lru_cache(maxsize=1024)
+def _verify(token: str) -> float:
+    """Full HS256 check; returns the token's exp. Failures raise and are never cached."""
+    payload = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
+    return payload.get("exp", math.inf)
+
 def require_auth(f):
     @wraps(f)
     def wrapper(*args, **kwargs):
@@ -19,7 +25,9 @@ def require_auth(f):
             return jsonify({"error": "missing token"}), 401
         token = auth.split(" ",1)[1]
         try:
-            jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
+            # polled routes re-send the same token; only its expiry needs re-checking
+            if _verify(token) <= time.time():
+                raise jwt.ExpiredSignatureError("Signature has expired")
         except Exception:
             return jsonify({"error": "invalid token"}), 401
         return f(*args, **kwargs)
@@ -1,6 +1,7 @@
 from __future__ import annotations
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Float, func, Index
-from sqlalchemy.orm import relationship
+from sqlalchemy import BigInteger, Column, Integer, String, Text, DateTime, ForeignKey, Float, JSON, func, Index
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import deferred, relationship
 from db import Base
 
 class Upload(Base):
@@ -14,18 +15,32 @@ class Upload(Base):
     status = Column(String(32), nullable=True)         # uploaded | processing | summarizing | done | failed
     progress = Column(Integer, nullable=True)          # 0–100
 
-    # raw uploaded content (parsed later)
-    raw_content = Column(Text, nullable=True)
+    # raw uploaded content (parsed later): stored on disk at raw_path (raw_bytes long);
+    # raw_content only holds bodies of uploads made before raw_path existed and not yet
+    # moved by `flask backfill-raw`. Deferred: only the analysis worker reads it.
+    raw_path = Column(String(512), nullable=True)
+    raw_bytes = Column(BigInteger, nullable=True)
+    raw_content = deferred(Column(Text, nullable=True))
+    # sha256 of the uploaded bytes: identical re-uploads reuse a cached ai_summary
+    content_sha256 = Column(String(64), nullable=True)
 
     # cached overall AI summary (single LLM call per upload)
-    ai_summary = Column(Text, nullable=True)
+    # Large cached payloads are deferred as the "analysis" group so status polls and
+    # progress updates load a small row; readers undefer_group("analysis").
+    ai_summary = deferred(Column(Text, nullable=True), group="analysis")
     ai_summary_model = Column(String(120), nullable=True)
     ai_summary_at = Column(DateTime(timezone=True), nullable=True)
 
+    # cached analysis output (written once by the worker, served by /api/analysis)
+    anomaly_groups_json = deferred(Column(JSON().with_variant(JSONB(), "postgresql"), nullable=True), group="analysis")
+    timeline_json = deferred(Column(JSON().with_variant(JSONB(), "postgresql"), nullable=True), group="analysis")
+
     # relationships
     events = relationship("LogEvent", back_populates="upload", cascade="all, delete-orphan")
     anomalies = relationship("Anomaly", back_populates="upload", cascade="all, delete-orphan")
 
+Index("ix_uploads_sha256_summary_at", Upload.content_sha256, Upload.ai_summary_at)
+
 class LogEvent(Base):
     __tablename__ = "log_events"
 
@@ -47,6 +62,12 @@ class LogEvent(Base):
 # Helpful indexes for common queries
 Index("ix_log_events_upload_ts", LogEvent.upload_id, LogEvent.ts)
 Index("ix_log_events_srcip", LogEvent.upload_id, LogEvent.src_ip)
+# cross-upload time-range scans: events arrive roughly in ts order, so a BRIN index
+# (per block-range min/max) stays tiny; Postgres only, other backends skip it
+Index(
+    "ix_log_events_ts_brin", LogEvent.ts,
+    postgresql_using="brin", postgresql_with={"pages_per_range": 32},
+).ddl_if(dialect="postgresql")
 
 class Anomaly(Base):
     __tablename__ = "anomalies"
@@ -1,85 +1,154 @@
 from datetime import datetime
-from typing import List, Dict, Any
+from typing import Dict, Any, Iterable, Iterator, Optional, Union
 import csv, io
+from itertools import islice
+from dataclasses import dataclass
 import json
+import pandas as pd
+
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
+# Parsers yield rows lazily from the full text or any iterable of lines (e.g. an open file);
+# parse_auth0_jsonl also takes bytes / binary files, which orjson parses without a decode
+Source = Union[str, Iterable[str]]
+BytesSource = Union[bytes, Iterable[bytes]]
+
+def _lines(src):
+    return _iter_lines(src) if isinstance(src, (str, bytes)) else src
+
+def _iter_lines(text):
+    # Slice one line at a time rather than materializing splitlines()'s list next to
+    # the text (io.StringIO would be worse: it copies the text into a UCS-4 buffer).
+    # Lines split on "\n" only; a trailing "\r" is whitespace to every consumer.
+    nl = b"\n" if isinstance(text, bytes) else "\n"
+    start, n = 0, len(text)
+    while start < n:
+        end = text.find(nl, start)
+        if end < 0:
+            end = n
+        yield text[start:end]
+        start = end + 1
 
 # Expected Zscaler‑ish CSV headers sample:
 # time,src_ip,user,url,action,status,bytes,user_agent
 
-def parse_auth0_jsonl(text: str, auth_domain: str = "auth.warptrace.corp"):
+@dataclass(slots=True)
+class Row:
+    """Fixed-schema row from the header-less parsers (JSONL, fallback); CSV rows stay dicts keyed by their header."""
+    time: Optional[str] = None
+    src_ip: Optional[str] = None
+    user: Optional[str] = None
+    url: Optional[str] = None
+    action: Optional[str] = None
+    status: Optional[int] = None
+    bytes: Optional[int] = None
+    user_agent: Optional[str] = None
+    raw: Optional[str] = None
+
+# Auth0 event type -> URL path / (action, status); anything else is a plain allow on "/"
+_URL_PATH_BY_TYPE = {
+    "s": "/authorize", "f": "/authorize",                  # login success/failure
+    "seacft": "/oauth/token", "feacft": "/oauth/token",    # token exchange success/failure
+}
+_ACTION_STATUS_BY_TYPE = {
+    "s": ("allow", 200), "seacft": ("allow", 200),
+    "f": ("allow", 401), "feacft": ("allow", 401),         # app rejected creds / token
+    "w": ("block", 403), "limit": ("block", 403), "blocked": ("block", 403),  # brute-force protection / blocked
+}
+
+def _loads_line(line):
+    try:
+        return _json_loads(line)
+    except ValueError:
+        if not isinstance(line, bytes):
+            raise
+        # undecodable bytes are dropped, as text-mode reads with errors="ignore" would
+        return _json_loads(line.decode("utf-8", "ignore"))
+
+def parse_auth0_jsonl(text: Union[Source, BytesSource], auth_domain: str = "auth.warptrace.corp") -> Iterator[Row]:
     """
-    Parse Auth0-style JSON Lines into Warptrace's normalized row dicts:
-    returns list[dict] with keys: time, src_ip, user, url, action, status, bytes, user_agent, raw
+    Parse Auth0-style JSON Lines into Warptrace's normalized rows, lazily:
+    yields Row(time, src_ip, user, url, action, status, bytes, user_agent, raw)
     """
-    out = []
-    for line in text.splitlines():
-        line = line.strip()
-        if not line:
+    base = f"https://{auth_domain}"
+    for line in _lines(text):
+        if not line or line.isspace():
             continue
-        obj = json.loads(line)
+        obj = _loads_line(line)
 
         etype = (obj.get("type") or "").lower()
         date = (obj.get("date") or "").strip()
 
-        # Choose URL by event type (rough approximation)
-        if etype in ("s", "f"):                  # login success/failure
-            url = f"https://{auth_domain}/authorize"
-        elif etype in ("seacft", "feacft"):      # token exchange success/failure
-            url = f"https://{auth_domain}/oauth/token"
-        else:
-            url = f"https://{auth_domain}/"
-
-        # Action/status mapping
-        if etype in ("s", "seacft"):
-            action, status = "allow", 200
-        elif etype in ("f", "feacft"):           # app rejected creds / token
-            action, status = "allow", 401
-        elif etype in ("w", "limit", "blocked"): # brute-force protection / blocked
-            action, status = "block", 403
-        else:
-            action, status = "allow", 200
-
-        ua = (
-            (obj.get("details") or {}).get("device")
-            or (obj.get("details") or {}).get("user_agent")
-            or "Auth0"
-        )
+        # Choose URL / action+status by event type (rough approximation)
+        url = base + _URL_PATH_BY_TYPE.get(etype, "/")
+        action, status = _ACTION_STATUS_BY_TYPE.get(etype, ("allow", 200))
 
-# Surface risk hints for anomaly engine
-        risk = ""
         det = obj.get("details") or {}
+        ua = det.get("device") or det.get("user_agent") or "Auth0"
+
+        # Surface risk hints for anomaly engine
+        risk = ""
         if isinstance(det.get("risk"), dict) and "score" in det["risk"]:
             risk = f" risk={det['risk'].get('score')} reason={det['risk'].get('reason','')}"
 
-        out.append({
-            "time": date,
-            "src_ip": obj.get("ip"),
-            "user": obj.get("user_name") or obj.get("user_id"),
-            "url": url,
-            "action": action,
-            "status": status,
-            "bytes": 0,
-            "user_agent": ua,
-            "raw": (obj.get("description") or obj.get("log_id") or "") + risk,
-        })
-    return out
-
-def parse_csv(content: str) -> List[Dict[str, Any]]:
-    rows = []
-    reader = csv.DictReader(io.StringIO(content))
-    for r in reader:
-        rows.append({k.strip(): (v.strip() if isinstance(v,str) else v) for k,v in r.items()})
-    return rows
-
-def parse_fallback_lines(content: str) -> List[Dict[str, Any]]:
-    rows = []
-    for line in content.splitlines():
+        yield Row(
+            time=date,
+            src_ip=obj.get("ip"),
+            user=obj.get("user_name") or obj.get("user_id"),
+            url=url,
+            action=action,
+            status=status,
+            user_agent=ua,
+            raw=(obj.get("description") or obj.get("log_id") or "") + risk,
+        )
+
+# rows per read_csv chunk: memory stays at one chunk however large the upload is
+_CSV_CHUNK_ROWS = 5000
+
+def parse_csv(content: Source) -> Iterator[Dict[str, Any]]:
+    def src():
+        if isinstance(content, str):
+            return io.StringIO(content)
+        content.seek(0)
+        return content
+
+    header = next(csv.reader(src()), None)
+    if header is None:
+        return
+    keys = [k.strip() for k in header]
+    if len(set(keys)) < len(keys):
+        # pandas renames repeated names (user, user.1); the stdlib reader keeps the last value
+        yield from _parse_csv_rows(src())
+        return
+
+    # everything stays a string, like csv.DictReader (counts are parsed at insert time)
+    done = 0
+    try:
+        for df in pd.read_csv(src(), dtype=str, keep_default_na=False, chunksize=_CSV_CHUNK_ROWS):
+            if not isinstance(df.index, pd.RangeIndex):
+                # surplus leading fields were turned into an index: ragged rows
+                raise pd.errors.ParserError("ragged rows")
+            cols = [[v.strip() for v in df[c].tolist()] for c in df.columns]
+            for vals in zip(*cols):
+                yield dict(zip(keys, vals))
+            done += len(df)
+    except pd.errors.EmptyDataError:
+        return
+    except pd.errors.ParserError:
+        # ragged rows: the forgiving stdlib reader takes over after the rows already yielded
+        yield from islice(_parse_csv_rows(src()), done, None)
+
+def _parse_csv_rows(lines: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    for r in csv.DictReader(lines):
+        yield {k.strip(): (v.strip() if isinstance(v,str) else v) for k,v in r.items()}
+
+def parse_fallback_lines(content: Source) -> Iterator[Row]:
+    for line in _lines(content):
         line = line.strip()
         if not line: 
             continue
-        rows.append({
-            "time": None, "src_ip": None, "user": None, "url": None,
-            "action": None, "status": None, "bytes": None, "user_agent": None,
-            "raw": line
-        })
-    return rows
+        yield Row(raw=line)
@@ -1,17 +1,39 @@
 from __future__ import annotations
-import os, json, re, logging, typing as t
+import hashlib, os, json, re, logging, typing as t
+from dataclasses import dataclass
+from functools import lru_cache
+from itertools import islice
 
+import httpx
 from openai import OpenAI
 from openai._exceptions import OpenAIError  # type: ignore
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# ---------- JSON for prompts / cache keys ----------
+def _dumps_bytes(obj: t.Any, *, sort_keys: bool = False) -> bytes:
+    """Compact UTF-8 JSON; orjson when available (several times faster on nested payloads)."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=str, option=orjson.OPT_SORT_KEYS if sort_keys else 0)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), sort_keys=sort_keys, default=str).encode()
+
+def _dumps(obj: t.Any) -> str:
+    return _dumps_bytes(obj).decode()
+
 # ---------- logging ----------
 log = logging.getLogger("warptrace.summarizer")
 
 # ---------- OpenRouter config (safe defaults) ----------
 OPENROUTER_BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
 DEFAULT_MODEL       = os.getenv("LLM_MODEL", "openrouter/auto")  # stable auto route
+# Per-anomaly summaries are 1–2 templated sentences: a small model is enough (with few-shots)
+DEFAULT_ITEM_MODEL  = "meta-llama/llama-3.1-8b-instruct"
 SITE = os.getenv("OPENROUTER_SITE_URL", "http://localhost:5173")
 APP  = os.getenv("OPENROUTER_APP_NAME", "WarpTrace")
+ANOMALY_BATCH = 12  # anomalies per chat completion in summarize_anomalies_batch
 
 def _or_headers() -> dict[str, str]:
     # OpenRouter asks for these headers to attribute usage.
@@ -22,27 +44,207 @@ def _or_headers() -> dict[str, str]:
         hdrs["HTTP-Referer"] = site
     return hdrs
 
+@dataclass(frozen=True)
+class _Cfg:
+    llm_on: bool
+    api_key: str | None
+    base_url: str
+    model_item: str
+    model_overall: str
+    headers: tuple[tuple[str, str], ...]
+
+def _load() -> _Cfg:
+    return _Cfg(
+        llm_on=os.getenv("LLM_ENABLED", "false").lower() == "true",
+        api_key=os.getenv("OPENROUTER_API_KEY") or None,
+        base_url=os.getenv("OPENROUTER_BASE_URL", OPENROUTER_BASE_URL),
+        model_item=os.getenv("LLM_MODEL_ITEM") or DEFAULT_ITEM_MODEL,
+        model_overall=os.getenv("LLM_MODEL_OVERALL") or os.getenv("LLM_MODEL", DEFAULT_MODEL),
+        headers=tuple(_or_headers().items()),
+    )
+
+# Environment is read once at import; call reload_config() after changing it (e.g. in tests)
+CFG = _load()
+
+def reload_config() -> None:
+    global CFG
+    CFG = _load()
+
+def overall_model() -> str:
+    """Model used for the overall upload summary (LLM_MODEL_OVERALL, else LLM_MODEL)."""
+    return CFG.model_overall
+
 def _client() -> OpenAI:
+    return _pooled_client(CFG.api_key, CFG.base_url, CFG.headers)
+
+@lru_cache(maxsize=4)
+def _pooled_client(api_key: str | None, base_url: str, headers: tuple[tuple[str, str], ...]) -> OpenAI:
+    # one keep-alive HTTP/2 pool per config, so TLS/TCP setup is paid once rather than
+    # per call; keyed on the settings so a rotated key or base URL gets a fresh client
+    http = httpx.Client(
+        http2=True,
+        limits=httpx.Limits(max_keepalive_connections=32, max_connections=64),
+        timeout=30.0,
+    )
     return OpenAI(
-        base_url=os.getenv("OPENROUTER_BASE_URL", OPENROUTER_BASE_URL),
-        api_key=os.getenv("OPENROUTER_API_KEY"),
-        default_headers=_or_headers(),
+        base_url=base_url,
+        api_key=api_key,
+        default_headers=dict(headers),
         timeout=30.0,
+        http_client=http,
     )
 
 # ---------- helpers ----------
 def _looks_html(s: str | None) -> bool:
     if not s: return False
-    t = s.strip().lower()
-    return t.startswith("<!doctype html") or t.startswith("<html")
+    # only the opening matters: lowercase a short prefix, not the whole completion
+    head = s.lstrip()[:16].lower()
+    return head.startswith(("<!doctype html", "<html"))
+
+# Reasoning blocks are cut with a left-to-right scan for their markers: each search
+# resumes where the last one ended, so the work is linear in the response even for
+# unclosed or nested markers (a lazy ".*?" sub restarts its scan at every opener).
+_THINK_OPEN = re.compile(r"<think>", re.IGNORECASE)
+_THINK_CLOSE = re.compile(r"</think>\s*", re.IGNORECASE)
+
+def _cut_blocks(text: str, find_open, find_close) -> str:
+    """Drop each opener..closer span; an opener with no closer after it leaves the rest as is."""
+    parts, pos = [], 0
+    while (span := find_open(text, pos)) is not None:
+        end = find_close(text, span[1])
+        if end is None:
+            break
+        parts.append(text[pos:span[0]])
+        pos = end
+    if not parts:
+        return text
+    parts.append(text[pos:])
+    return "".join(parts)
 
-def _strip_reasoning(text: str) -> str:
+def _find_think(text: str, pos: int) -> tuple[int, int] | None:
+    m = _THINK_OPEN.search(text, pos)
+    return m.span() if m else None
+
+def _find_think_end(text: str, pos: int) -> int | None:
+    m = _THINK_CLOSE.search(text, pos)
+    return m.end() if m else None
+
+def _find_fence(text: str, pos: int) -> tuple[int, int] | None:
+    i = text.find("```", pos)
+    return (i, i + 3) if i >= 0 else None
+
+def _find_fence_end(text: str, pos: int) -> int | None:
+    i = text.find("```", pos)
+    return i + 3 if i >= 0 else None
+
+def _strip_reasoning(text: str, *, strip_fences: bool = True) -> str:
+    # JSON answers keep their fences: a ```json block is the payload, not scratch work
     if not text:
         return text
-    text = re.sub(r"<think>.*?</think>\s*", "", text, flags=re.DOTALL | re.IGNORECASE)
-    text = re.sub(r"```(?:thinking|reasoning)?\s*.*?```", "", text, flags=re.DOTALL | re.IGNORECASE)
+    text = _cut_blocks(text, _find_think, _find_think_end)
+    if strip_fences:
+        text = _cut_blocks(text, _find_fence, _find_fence_end)
     return text.strip()
 
+def _json_array(text: str) -> list[t.Any]:
+    # tolerate prose around the array; the model doesn't always obey "JSON only"
+    start, end = text.find("["), text.rfind("]")
+    if start < 0 or end < start:
+        raise ValueError("no_json_array")
+    arr = json.loads(text[start:end + 1])
+    if not isinstance(arr, list):
+        raise ValueError("no_json_array")
+    return arr
+
+def _anomaly_payload(anom: dict[str, t.Any], samples: list[dict[str, t.Any]]) -> dict[str, t.Any]:
+    return {
+        "reason": anom.get("reason"),
+        "kind": anom.get("kind"),
+        "user": (anom.get("meta") or {}).get("user"),
+        "src_ip": (anom.get("meta") or {}).get("src_ip"),
+        "samples": [{
+            "ts": s.get("ts"),
+            "user": s.get("user"),
+            "ip": s.get("src_ip"),
+            "status": s.get("status"),
+            "url": (s.get("url") or "")[:120],
+            "ua": (s.get("user_agent") or "")[:80],
+        } for s in (samples or [])[:5]],
+    }
+
+def _anomaly_samples(anoms: list[dict[str, t.Any]], samples_by_id: dict[t.Any, dict[str, t.Any]]) -> list[list[dict[str, t.Any]]]:
+    # up to 5 sample events per anomaly, looked up from meta.event_ids
+    samples_by_id = samples_by_id or {}
+    return [
+        [samples_by_id[i] for i in ((a.get("meta") or {}).get("event_ids") or []) if i in samples_by_id][:5]
+        for a in anoms
+    ]
+
+# Few-shot (payload, summary) pairs for the per-anomaly prompts, to keep small models on format
+_ITEM_EXAMPLES = [
+    ({"reason": "Brute-force suspected against user alice", "kind": "auth.bruteforce_user",
+      "user": "alice", "src_ip": None, "samples": [{"ts": "2024-05-01T03:12:09Z", "user": "alice",
+      "ip": "203.0.113.7", "status": 401, "url": "https://auth.example.com/authorize", "ua": "curl/8.4.0"}]},
+     "Lock alice's account and reset the password, then block 203.0.113.7 and enforce MFA before re-enabling access."),
+    ({"reason": "Rare user-agent seen 1x: sqlmap/1.7", "kind": "web.rare_ua", "user": None, "src_ip": None,
+      "samples": [{"ts": "2024-05-01T04:40:51Z", "user": None, "ip": "198.51.100.23", "status": 403,
+      "url": "https://app.example.com/search?q=1'--", "ua": "sqlmap/1.7"}]},
+     "Block 198.51.100.23 and rate-limit unknown scanners, then check the app logs for successful injection attempts."),
+]
+
+def _anomaly_messages(anom: dict[str, t.Any], samples: list[dict[str, t.Any]]) -> list[dict[str, str]]:
+    system = (
+        "You are a senior SOC analyst. Write a concise, actionable summary of the anomaly. "
+        "Rules: 1–2 short sentences, imperative voice. No metrics or probabilities. "
+        "Focus on next steps: validate user, reset creds, enforce MFA, block/geo-fence IP, correlate with deploys."
+    )
+    msgs = [{"role":"system","content":system}]
+    for payload, summary in _ITEM_EXAMPLES:
+        msgs.append({"role":"user","content":"Anomaly context (JSON):\n" + _dumps(payload)})
+        msgs.append({"role":"assistant","content":summary})
+    user = "Anomaly context (JSON):\n" + _dumps(_anomaly_payload(anom, samples))
+    msgs.append({"role":"user","content":user})
+    return msgs
+
+# Rule-based text by anomaly kind: exact kinds first, then kind-prefix families
+_Handler = t.Callable[[t.Any, t.Any], str]
+
+def _handler(exact: dict[str, _Handler], prefixes: tuple[tuple[str, _Handler], ...], kind: str) -> _Handler | None:
+    h = exact.get(kind)
+    if h is None:
+        for prefix, ph in prefixes:
+            if kind.startswith(prefix):
+                return ph
+    return h
+
+# (example user, example ip) -> one bullet of the overall summary
+_LOG_LINES: dict[str, _Handler] = {
+    "auth.blocked": lambda user, ip: "Review Auth0 blocks and preceding failures; if legit, force password reset and re-enroll MFA.",
+    "auth.high_risk": lambda user, ip: f"Verify session owners (e.g., {user}); block/geo-fence suspect IPs (e.g., {ip}) and require step-up MFA.",
+    "web.rare_ua": lambda user, ip: "Validate rare clients; if unsanctioned, rate-limit or block and capture samples.",
+    "auth.offhours": lambda user, ip: "Confirm off-hours access and enable conditional access or step-up MFA.",
+    "auth.token_fail_burst": lambda user, ip: "Audit client credential usage/rotation and OAuth scopes for token failure spikes.",
+}
+_LOG_LINES["auth.tor"] = _LOG_LINES["auth.high_risk"]
+_LOG_LINE_PREFIXES: tuple[tuple[str, _Handler], ...] = (
+    ("auth.bruteforce", lambda user, ip: f"Investigate repeated login failures (e.g., {user} from {ip}); lock account, reset password, enforce MFA."),
+    ("web.error_", lambda user, ip: "Correlate elevated error rates with deploys/metrics; mitigate and watch for abuse patterns."),
+)
+
+# (user or None, ip or None) -> per-anomaly advice
+_ITEM_LINES: dict[str, _Handler] = {
+    "auth.blocked": lambda user, ip: f"Review the blocked login and preceding failures for {user or 'the account'}. If legitimate, force a password reset and re-enroll MFA.",
+    "auth.high_risk": lambda user, ip: f"Verify the session owner for {user or 'the account'} out-of-band. Geo-fence or block {ip or 'this IP'} and require step-up MFA.",
+    "web.rare_ua": lambda user, ip: "Confirm whether the rare client is sanctioned. If not, rate-limit or block and capture request samples.",
+    "auth.offhours": lambda user, ip: "Confirm off-hours access with the user and enable step-up MFA or conditional access for unusual times.",
+    "auth.token_fail_burst": lambda user, ip: "Audit client credentials usage and rotation. Check for expired or leaked secrets and misconfigured OAuth scopes.",
+}
+_ITEM_LINES["auth.tor"] = _ITEM_LINES["auth.high_risk"]
+_ITEM_LINE_PREFIXES: tuple[tuple[str, _Handler], ...] = (
+    ("auth.bruteforce", lambda user, ip: f"Investigate rapid failed logins for {user or 'this account'} from {ip or 'one source'}. Lock the account, reset the password, and review recent IP activity."),
+    ("web.error_", lambda user, ip: "Correlate the elevated error rate with deploys and service metrics. Roll back or mitigate and watch for abuse patterns."),
+)
+
 def _rule_based_log_summary(context: dict[str, t.Any], groups: list[dict[str, t.Any]], timeline: list[dict[str, t.Any]]) -> str:
     lines = []
     c = (context or {}).get("counts", {})
@@ -51,22 +253,8 @@ def _rule_based_log_summary(context: dict[str, t.Any], groups: list[dict[str, t.
         kind = g.get("kind","finding")
         ex_user = (g.get("users") or ["users"])[0]
         ex_ip   = (g.get("src_ips") or ["sources"])[0]
-        if kind.startswith("auth.bruteforce"):
-            lines.append(f"Investigate repeated login failures (e.g., {ex_user} from {ex_ip}); lock account, reset password, enforce MFA.")
-        elif kind == "auth.blocked":
-            lines.append("Review Auth0 blocks and preceding failures; if legit, force password reset and re-enroll MFA.")
-        elif kind in ("auth.high_risk","auth.tor"):
-            lines.append(f"Verify session owners (e.g., {ex_user}); block/geo-fence suspect IPs (e.g., {ex_ip}) and require step-up MFA.")
-        elif kind.startswith("web.error_"):
-            lines.append("Correlate elevated error rates with deploys/metrics; mitigate and watch for abuse patterns.")
-        elif kind == "web.rare_ua":
-            lines.append("Validate rare clients; if unsanctioned, rate-limit or block and capture samples.")
-        elif kind == "auth.offhours":
-            lines.append("Confirm off-hours access and enable conditional access or step-up MFA.")
-        elif kind == "auth.token_fail_burst":
-            lines.append("Audit client credential usage/rotation and OAuth scopes for token failure spikes.")
-        else:
-            lines.append(f"Address {kind} findings with targeted containment and user validation.")
+        h = _handler(_LOG_LINES, _LOG_LINE_PREFIXES, kind)
+        lines.append(h(ex_user, ex_ip) if h else f"Address {kind} findings with targeted containment and user validation.")
     return "• " + "\n• ".join(lines)
 
 def _rule_based_summary(anom: dict[str, t.Any], samples: list[dict[str, t.Any]]) -> str:
@@ -75,27 +263,31 @@ def _rule_based_summary(anom: dict[str, t.Any], samples: list[dict[str, t.Any]])
     user = meta.get("user") or (samples[0].get("user") if samples else None)
     ip   = meta.get("src_ip") or (samples[0].get("src_ip") if samples else None)
 
-    if kind.startswith("auth.bruteforce"):
-        who = user or "this account"; src = ip or "one source"
-        return f"Investigate rapid failed logins for {who} from {src}. Lock the account, reset the password, and review recent IP activity."
-    if kind == "auth.blocked":
-        who = user or "the account"
-        return f"Review the blocked login and preceding failures for {who}. If legitimate, force a password reset and re-enroll MFA."
-    if kind in ("auth.high_risk", "auth.tor"):
-        who = user or "the account"; src = ip or "this IP"
-        return f"Verify the session owner for {who} out-of-band. Geo-fence or block {src} and require step-up MFA."
-    if kind.startswith("web.error_"):
-        return "Correlate the elevated error rate with deploys and service metrics. Roll back or mitigate and watch for abuse patterns."
-    if kind == "web.rare_ua":
-        return "Confirm whether the rare client is sanctioned. If not, rate-limit or block and capture request samples."
-    if kind == "auth.offhours":
-        return "Confirm off-hours access with the user and enable step-up MFA or conditional access for unusual times."
-    if kind == "auth.token_fail_burst":
-        return "Audit client credentials usage and rotation. Check for expired or leaked secrets and misconfigured OAuth scopes."
+    h = _handler(_ITEM_LINES, _ITEM_LINE_PREFIXES, kind)
+    if h:
+        return h(user, ip)
     return (anom.get("reason") or "Review this anomaly.") + " Take immediate, minimal steps to validate and contain."
 
 # ---------- low-level LLM call ----------
-def _chat(messages: list[dict[str, str]], *, model: str, temperature=0.2, max_tokens=220) -> str:
+def _completion_text(comp: t.Any, *, base_url: t.Any, model: str, strip_fences: bool = True) -> str:
+    return _checked_text((comp.choices[0].message.content or "").strip(), base_url=base_url, model=model, strip_fences=strip_fences)
+
+def _checked_text(txt: str, *, base_url: t.Any, model: str, strip_fences: bool = True) -> str:
+    if _looks_html(txt):
+        log.warning("openrouter html_response_detected base=%s model=%s (check API key & headers)", base_url, model)
+        raise RuntimeError("html_response")
+    return _strip_reasoning(txt, strip_fences=strip_fences)
+
+def _log_api_error(e: OpenAIError) -> None:
+    status = getattr(e, "status_code", None) or getattr(e, "status", None)
+    body   = getattr(e, "response", None)
+    try:
+        body = getattr(body, "json", lambda: {})()
+    except Exception:
+        body = str(body)
+    log.warning("openrouter api_error status=%s detail=%s", status, body)
+
+def _chat(messages: list[dict[str, str]], *, model: str, temperature=0.2, max_tokens=220, strip_fences: bool = True) -> str:
     client = _client()
     try:
         comp = client.chat.completions.create(
@@ -104,29 +296,33 @@ def _chat(messages: list[dict[str, str]], *, model: str, temperature=0.2, max_to
             temperature=temperature,
             max_tokens=max_tokens,
         )
-        txt = (comp.choices[0].message.content or "").strip()
-        if _looks_html(txt):
-            log.warning("openrouter html_response_detected base=%s model=%s (check API key & headers)", client.base_url, model)
-            raise RuntimeError("html_response")
-        return _strip_reasoning(txt)
+        return _completion_text(comp, base_url=client.base_url, model=model, strip_fences=strip_fences)
     except OpenAIError as e:
-        status = getattr(e, "status_code", None) or getattr(e, "status", None)
-        body   = getattr(e, "response", None)
-        try:
-            body = getattr(body, "json", lambda: {})()
-        except Exception:
-            body = str(body)
-        log.warning("openrouter api_error status=%s detail=%s", status, body)
+        _log_api_error(e)
         raise
     except Exception as e:
         log.warning("openrouter client_error err=%s", e)
         raise
 
+# ---------- per-anomaly de-dupe ----------
+# Bursts (brute force, blocks, ...) yield many anomalies with the same kind/user/ip/reason
+# and effectively the same advice, so a batch asks about each shape once. The dedupe is
+# scoped to one call (one upload): the prompt also carries the sample IPs, URLs and UAs,
+# so an answer must never be served for another upload's events.
+def _fingerprint(anom: dict[str, t.Any]) -> bytes:
+    meta = anom.get("meta") or {}
+    shape = {
+        "kind": anom.get("kind"), "user": meta.get("user"), "src_ip": meta.get("src_ip"),
+        "reason": anom.get("reason"),
+    }
+    return hashlib.blake2b(_dumps_bytes(shape, sort_keys=True), digest_size=16).digest()
+
 # ---------- single-anomaly summary ----------
 def summarize_anomaly(anom: dict[str, t.Any], samples: list[dict[str, t.Any]]) -> str:
-    llm_on  = os.getenv("LLM_ENABLED", "false").lower() == "true"
-    has_key = bool(os.getenv("OPENROUTER_API_KEY"))
-    model   = os.getenv("LLM_MODEL", DEFAULT_MODEL)
+    cfg     = CFG
+    llm_on  = cfg.llm_on
+    has_key = bool(cfg.api_key)
+    model   = cfg.model_item
 
     log.info(
         "summarize start kind=%s llm_enabled=%s key=%s model=%s samples=%d",
@@ -139,31 +335,7 @@ def summarize_anomaly(anom: dict[str, t.Any], samples: list[dict[str, t.Any]]) -
 
     if llm_on and has_key:
         try:
-            payload = {
-                "reason": anom.get("reason"),
-                "kind": anom.get("kind"),
-                "user": (anom.get("meta") or {}).get("user"),
-                "src_ip": (anom.get("meta") or {}).get("src_ip"),
-                "samples": [{
-                    "ts": s.get("ts"),
-                    "user": s.get("user"),
-                    "ip": s.get("src_ip"),
-                    "status": s.get("status"),
-                    "url": (s.get("url") or "")[:120],
-                    "ua": (s.get("user_agent") or "")[:80],
-                } for s in (samples or [])[:5]],
-            }
-            system = (
-                "You are a senior SOC analyst. Write a concise, actionable summary of the anomaly. "
-                "Rules: 1–2 short sentences, imperative voice. No metrics or probabilities. "
-                "Focus on next steps: validate user, reset creds, enforce MFA, block/geo-fence IP, correlate with deploys."
-            )
-            user = "Anomaly context (JSON):\n" + json.dumps(payload, ensure_ascii=False)
-
-            text = _chat(
-                [{"role":"system","content":system}, {"role":"user","content":user}],
-                model=model, temperature=0.2, max_tokens=120
-            )
+            text = _chat(_anomaly_messages(anom, samples), model=model, temperature=0.2, max_tokens=120)
             log.info("summarize llm_ok chars=%d model=%s", len(text), model)
             return text
         except Exception:
@@ -173,56 +345,139 @@ def summarize_anomaly(anom: dict[str, t.Any], samples: list[dict[str, t.Any]]) -
     log.info("summarize fallback_ok chars=%d", len(text))
     return text
 
-# ---------- overall-log summary (one call per upload) ----------
-def summarize_log(*, context: dict[str, t.Any], groups: list[dict[str, t.Any]], timeline: list[dict[str, t.Any]]) -> str:
-    llm_on  = os.getenv("LLM_ENABLED", "false").lower() == "true"
-    has_key = bool(os.getenv("OPENROUTER_API_KEY"))
-    model   = os.getenv("LLM_MODEL", DEFAULT_MODEL)
+# ---------- batched per-anomaly summaries (one call per ANOMALY_BATCH anomalies) ----------
+def summarize_anomalies_batch(anoms: list[dict[str, t.Any]], samples_by_id: dict[t.Any, dict[str, t.Any]]) -> list[str]:
+    """
+    Summaries for many anomalies, aligned with `anoms`. samples_by_id maps event id -> event
+    dict; each anomaly's samples are looked up from meta.event_ids. Items the model skips
+    (or whole batches that fail) fall back to the rule-based summary.
+    """
+    cfg     = CFG
+    llm_on  = cfg.llm_on
+    has_key = bool(cfg.api_key)
+    model   = cfg.model_item
+
+    anoms = list(anoms or [])
+    samples = _anomaly_samples(anoms, samples_by_id)
+    texts: list[str | None] = [None] * len(anoms)
 
     log.info(
-        "summarize_log start llm=%s key=%s base=%s model=%s groups=%d",
-        llm_on, "yes" if has_key else "no", os.getenv("OPENROUTER_BASE_URL", OPENROUTER_BASE_URL), model, len(groups or [])
+        "summarize_batch start n=%d llm_enabled=%s key=%s model=%s",
+        len(anoms), llm_on, "yes" if has_key else "no", model,
     )
 
+    if llm_on and has_key:
+        system = (
+            "You are a senior SOC analyst. For each anomaly in the JSON array, write a concise, actionable summary. "
+            "Rules: 1–2 short sentences each, imperative voice. No metrics or probabilities. "
+            "Focus on next steps: validate user, reset creds, enforce MFA, block/geo-fence IP, correlate with deploys. "
+            'Return only a JSON array where each element is {"id": <id>, "summary": "<text>"}; no code fences.\n'
+            "Example input: " + _dumps([{"id": i, **p} for i, (p, _) in enumerate(_ITEM_EXAMPLES)]) + "\n"
+            "Example output: " + _dumps([{"id": i, "summary": x} for i, (_, x) in enumerate(_ITEM_EXAMPLES)])
+        )
+        # each shape is asked once; its answer is shared by the anomalies of that shape
+        keys = [_fingerprint(a) for a in anoms]
+        todo: dict[bytes, int] = {}  # fingerprint -> representative anomaly index
+        answered: dict[bytes, str] = {}
+        for i, key in enumerate(keys):
+            todo.setdefault(key, i)
+        ids = iter(todo.values())
+        while batch := list(islice(ids, ANOMALY_BATCH)):
+            try:
+                payload = [{"id": i, **_anomaly_payload(anoms[i], samples[i])} for i in batch]
+                user = "Anomalies (JSON):\n" + _dumps(payload)
+                text = _chat(
+                    [{"role":"system","content":system}, {"role":"user","content":user}],
+                    model=model, temperature=0.2, max_tokens=80 * len(batch), strip_fences=False,
+                )
+                wanted = set(batch)
+                for item in _json_array(text):
+                    if not isinstance(item, dict):
+                        continue
+                    i, summary = item.get("id"), item.get("summary")
+                    if i in wanted and isinstance(summary, str) and summary.strip():
+                        answered[keys[i]] = summary.strip()
+            except Exception as e:
+                log.warning("summarize_batch llm_failed size=%d err=%s", len(batch), e)
+        texts = [answered.get(key) for key in keys]
+
+    llm_ok = sum(1 for x in texts if x is not None)
+    out = [x if x is not None else _rule_based_summary(a, smp) for x, a, smp in zip(texts, anoms, samples)]
+    log.info("summarize_batch done llm_ok=%d fallback=%d", llm_ok, len(out) - llm_ok)
+    return out
+
+# ---------- overall-log summary (one call per upload) ----------
+_BASELINE_SUMMARY = (
+    "No investigation necessary — events align with expected baseline. "
+    "No anomalous authentication or traffic patterns detected."
+)
+
+def _is_baseline(context: dict[str, t.Any], groups: list[dict[str, t.Any]]) -> bool:
     total_groups = len(groups or [])
     total_anoms  = (context or {}).get("counts", {}).get("anomalies", total_groups)
+    return total_groups == 0 or total_anoms == 0
 
-    # --- clean baseline message
-    if total_groups == 0 or total_anoms == 0:
-        return (
-            "No investigation necessary — events align with expected baseline. "
-            "No anomalous authentication or traffic patterns detected."
-        )
+def _rle_timeline(points: list[dict[str, t.Any]]) -> list[dict[str, t.Any]]:
+    """Collapse consecutive per-minute points with equal counts into {from, to, count, n} runs."""
+    runs: list[dict[str, t.Any]] = []
+    for p in points:
+        minute, count = p.get("minute"), p.get("count")
+        if runs and runs[-1]["count"] == count:
+            runs[-1]["to"] = minute
+            runs[-1]["n"] += 1
+        else:
+            runs.append({"from": minute, "to": minute, "count": count, "n": 1})
+    return runs
+
+_TOP_N = 3  # users / src_ips per group in the overview prompt
 
+def _log_messages(context: dict[str, t.Any], groups: list[dict[str, t.Any]], timeline: list[dict[str, t.Any]]) -> list[dict[str, str]]:
+    # prompt tokens drive latency and cost: send run-length timeline and a few examples per group
     payload = {
         "context": context,
         "groups": [
-            {k: v for k, v in g.items() if k in ("kind","count","reasons","users","src_ips")}
-            for g in (groups or [])
-        ][:8],
-        "timeline": (timeline or [])[-60:],
+            {
+                "kind": g.get("kind"), "count": g.get("count"), "reasons": g.get("reasons"),
+                "users": (g.get("users") or [])[:_TOP_N], "src_ips": (g.get("src_ips") or [])[:_TOP_N],
+            }
+            for g in (groups or [])[:8]
+        ],
+        "timeline": _rle_timeline((timeline or [])[-60:]),
     }
+    system = (
+        "You are a senior SOC analyst. Produce a concise incident overview of this log upload. "
+        "4–7 bullet points, imperative voice; do not include probabilities. "
+        "Call out top finding types, affected users/IPs, and next steps (MFA, resets, blocks, geo-fence, correlate with deploys)."
+    )
+    user = "Analysis input (JSON):\n" + _dumps(payload)
+    return [{"role":"system","content":system}, {"role":"user","content":user}]
+
+def summarize_log(*, context: dict[str, t.Any], groups: list[dict[str, t.Any]], timeline: list[dict[str, t.Any]]) -> tuple[str, str | None]:
+    """(summary text, model that wrote it); the model is None for baseline/rule-based text."""
+    cfg     = CFG
+    llm_on  = cfg.llm_on
+    has_key = bool(cfg.api_key)
+    model   = cfg.model_overall
+
+    log.info(
+        "summarize_log start llm=%s key=%s base=%s model=%s groups=%d",
+        llm_on, "yes" if has_key else "no", cfg.base_url, model, len(groups or [])
+    )
+
+    # --- clean baseline message
+    if _is_baseline(context, groups):
+        return _BASELINE_SUMMARY, None
 
     if llm_on and has_key:
         try:
-            system = (
-                "You are a senior SOC analyst. Produce a concise incident overview of this log upload. "
-                "4–7 bullet points, imperative voice; do not include probabilities. "
-                "Call out top finding types, affected users/IPs, and next steps (MFA, resets, blocks, geo-fence, correlate with deploys)."
-            )
-            user = "Analysis input (JSON):\n" + json.dumps(payload, ensure_ascii=False)
-
-            text = _chat(
-                [{"role":"system","content":system}, {"role":"user","content":user}],
-                model=model, temperature=0.2, max_tokens=220
-            )
+            text = _chat(_log_messages(context, groups, timeline), model=model, temperature=0.2, max_tokens=220)
             if len(text) > 2000:
                 text = text[:2000].rstrip() + "…"
             log.info("summarize_log llm_ok chars=%d", len(text))
-            return text
+            return text, model
         except Exception as e:
             log.warning("summarize_log llm_failed err=%s", e)
 
     rb = _rule_based_log_summary(context, groups, timeline)
     log.info("summarize_log fallback_ok chars=%d", len(rb))
-    return rb
+    return rb, None